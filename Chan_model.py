@@ -5,14 +5,17 @@
 # created 23.02.2024; updated 03.03.2024
 #
 
+import re
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import numexpr as ne
+from numba import njit, prange, types
 from tkinter import messagebox
-import matplotlib.pyplot as plt
-import csv
-import logging
-from scipy.interpolate import interp1d
 
 mu_0 = 1.25663706212e-6  # vacuum magnetic permeability
+csv_header = '"H, A/m","Upper B, T","Lower B, T"'  # header of the output CSV files
 
 # Other parameters used for simulations:
 # Hc - coercivity without a gap, A/m
@@ -23,45 +26,89 @@ mu_0 = 1.25663706212e-6  # vacuum magnetic permeability
 # Lg - length of the gap, m
 # S - cross-section of the magnetic core, m^2
 
-# Configure logging
-logging.basicConfig(filename='simulation_log.log', level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+# Grid of the magnetising force H (A/m), reused by the runs with the same Hmax and N.
+# The grid is made exactly symmetric, H[N - 1 - i] = -H[i], and read-only as it is shared between the runs
+@lru_cache(maxsize=8)
+def _H_grid(Hmax, N):
+    H = np.linspace(-Hmax, Hmax, N)
+    H = (H - H[::-1]) / 2.0
+    H.setflags(write=False)
+    return H
+
+# Ungapped branches of Chan's model on the symmetric grid H (A/m): upper branch B1 (T) and lower branch B2 (T).
+# The branches are mirror images through the origin, B2(H) = -B1(-H), so only B1 is evaluated and
+# B2 is obtained by reflection. The branches are vertically adjusted by dB in the same pass for drawing a minor loop.
+# The pass is spread over the CPU cores for large N. The explicit signature compiles the kernel when the program
+# starts (or loads it from the cache) rather than on the first run
+@njit(types.UniTuple(types.float64[::1], 2)(types.Array(types.float64, 1, 'C', readonly=True),
+                                             types.float64, types.float64, types.float64),
+      parallel=True, fastmath=True, cache=True)
+def _compute_branches(H, Bs, Br, Hc):
+    N = H.shape[0]
+    B1 = np.empty(N)
+    B2 = np.empty(N)
+    k = Hc * (Bs / Br - 1.0)
+    h = H[N - 1]
+    dB = (Bs * (h + Hc) / (abs(h + Hc) + k) - Bs * (h - Hc) / (abs(h - Hc) + k)) / 2.0
+    for i in prange(N):  # Each i writes its own B1[i] and B2[N - 1 - i]
+        hp = H[i] + Hc
+        B = Bs * hp / (abs(hp) + k)
+        B1[i] = B - dB
+        B2[N - 1 - i] = dB - B
+    return B1, B2
+
+# Coercivity of a branch: H at which the monotonic branch B(H) crosses zero.
+# The crossing is bracketed by bisection, and H(B) is evaluated at B = 0 with the cubic
+# (Lagrange) interpolation through the four nearest points
+def _find_zero_crossing(B_values, H_values):
+    if len(B_values) < 4:
+        raise ValueError("At least 4 points are needed to find Hc by cubic interpolation.")
+    i = np.searchsorted(B_values, 0.0)
+    if i == 0 or i == len(B_values):
+        raise ValueError("The branch does not cross B = 0 within the H range.")
+    j = min(max(i - 2, 0), len(B_values) - 4)
+    B = B_values[j:j + 4]
+    H = H_values[j:j + 4]
+    Hc = 0.0
+    for m in range(len(B)):
+        weight = 1.0
+        for n in range(len(B)):
+            if n != m:
+                weight *= B[n] / (B[n] - B[m])
+        Hc += weight * H[m]
+    return float(Hc)
+
+# Save the BH-loop data: H (A/m), upper branch B1 (T) and lower branch B2 (T)
+def _save_csv(file_name, H_values, B1_values, B2_values):
+    with open(file_name, mode='w', newline='', buffering=1 << 20) as file:  # 1 MB buffer: np.savetxt writes row by row
+        np.savetxt(file, np.column_stack((H_values, B1_values, B2_values)),
+                   fmt='%.8g', delimiter=',', header=csv_header, comments='')
 
 def read_log_file():
     try:
         with open('simulation_log.log', 'r') as log_file:
             lines = log_file.readlines()
-            params_found = False
-            params = []
-            for line in lines:
-                if "Simulation parameters:" in line:
-                    params = line.split(':')[1].strip().split(',')
-                    if len(params) == 8:  # Ensure the correct number of parameters
-                        params_found = True
-            if params_found:
-                entry_Bs.delete(0, tk.END)
-                entry_Bs.insert(0, params[0].split('=')[1])
-                entry_Br.delete(0, tk.END)
-                entry_Br.insert(0, params[1].split('=')[1])
-                entry_Hc.delete(0, tk.END)
-                entry_Hc.insert(0, params[2].split('=')[1])
-                entry_Hmax.delete(0, tk.END)
-                entry_Hmax.insert(0, params[3].split('=')[1])
-                entry_N.delete(0, tk.END)
-                entry_N.insert(0, params[4].split('=')[1])
-                entry_Lm.delete(0, tk.END)
-                entry_Lm.insert(0, params[5].split('=')[1])
-                entry_Lg.delete(0, tk.END)
-                entry_Lg.insert(0, params[6].split('=')[1])
-                entry_S.delete(0, tk.END)
-                entry_S.insert(0, params[7].split('=')[1])
-                messagebox.showinfo("Parameters Loaded", "Simulation parameters loaded from log file.")
-            else:
-                messagebox.showwarning("Log File Error", "Invalid format of simulation parameters in log file.")
+        params = {}
+        for line in reversed(lines):  # Parameters of the latest run
+            if "Simulation parameters:" in line:
+                params = dict(re.findall(r'(\w+)=([-\d.eE+]+)', line))
+                break
+        entries = {'Bs': entry_Bs, 'Br': entry_Br, 'Hc': entry_Hc, 'Hmax': entry_Hmax,
+                   'N': entry_N, 'Lm': entry_Lm, 'Lg': entry_Lg, 'S': entry_S}
+        if all(name in params for name in entries):  # Ensure all the parameters are present
+            for name, entry in entries.items():
+                entry.delete(0, tk.END)
+                entry.insert(0, params[name])
+            messagebox.showinfo("Parameters Loaded", "Simulation parameters loaded from log file.")
+        else:
+            messagebox.showwarning("Log File Error", "Invalid format of simulation parameters in log file.")
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred while reading log file: {str(e)}")
 
 def run_simulation():
     try:
+        import matplotlib.pyplot as plt  # Imported on the first run to speed up the start of the GUI
+
         # Retrieve values from the GUI
         Bs = float(entry_Bs.get())  # Saturation induction (flux density), Tesla (T)
         Br = float(entry_Br.get())  # Residual induction, Tesla (T)
@@ -72,107 +119,77 @@ def run_simulation():
         Lg = float(entry_Lg.get())  # Length of the gap, m
         S = float(entry_S.get())  # Cross-section of the magnetic core, m^2
 
-        # Log input values
-        logging.info(f"Simulation parameters: Bs={Bs}, Br={Br}, Hc={Hc}, Hmax={Hmax}, N={N}, Lm={Lm}, Lg={Lg}, S={S}")
-
-        # Clear log file
-        open('simulation_log.log', 'w').close()
-
-        # Write parameters from the current run to log file
-        with open('simulation_log.log', 'a') as log_file:
+        # Write parameters from the current run to log file (overwriting the previous run)
+        with open('simulation_log.log', 'w') as log_file:
             log_file.write(f"Simulation parameters: Bs={Bs}, Br={Br}, Hc={Hc}, Hmax={Hmax}, N={N}, Lm={Lm}, Lg={Lg}, S={S}\n")
 
         # UNGAPPED BH-loop: saturated or minor (unsaturated)
-        # Calculate lists: H (A/m), BH-loop consisting of the branches B1(T) and B2(T)
-        H_values = [-Hmax + 2 * Hmax * i / (N - 1) for i in range(N)]  # Magnetising force, A/m
-
-        # dB - branch vertical adjustment for drawing a minor loop
-        dB = Bs * (H_values[N - 1] + Hc) / (abs(H_values[N - 1] + Hc) + Hc * (Bs / Br - 1.0))
-        dB = (dB - (Bs * (H_values[N - 1] - Hc) / (abs(H_values[N - 1] - Hc) + Hc * (Bs / Br - 1.0)))) / 2.0
-
-        # The following curves are vertically adjusted:
-        B1_values = [(Bs * (H + Hc) / (abs(H + Hc) + Hc * (Bs / Br - 1.0)) - dB) for H in H_values]  # Upper branch
-        B2_values = [(Bs * (H - Hc) / (abs(H - Hc) + Hc * (Bs / Br - 1.0)) + dB) for H in H_values]  # Lower branch
+        # Calculate arrays: H (A/m), BH-loop consisting of the branches B1(T) and B2(T)
+        H_values = _H_grid(Hmax, N)  # Magnetising force, A/m
+        B1_values, B2_values = _compute_branches(H_values, Bs, Br, Hc)  # Vertically adjusted branches
 
         # Find the new Hc if considering a minor BH-loop
-        interp_func = interp1d(B2_values, H_values, kind='cubic')  # cubic-spline interpolation
-        Hcm = float(interp_func(0))  # Hc_ungapped
+        Hcm = _find_zero_crossing(B2_values, H_values)  # Hc_ungapped
 
         # GAPPED BH-loop: saturated or minor (unsaturated)
-        mu1_values = [(B / (mu_0 * (H + Hcm))) for H, B in zip(H_values, B1_values)]  # Relative permeability for B1
-        mu1_values = [1.0 if value < 1.0 else value for value in mu1_values]  # Checking the condition mu >=1
-        mu2_values = [(B / (mu_0 * (H - Hcm))) for H, B in zip(H_values, B2_values)]  # Relative permeability for B2
-        mu2_values = [1.0 if value < 1.0 else value for value in mu2_values]  # Checking the condition mu >=1
+        Hp_values = H_values + Hcm  # Field shifted by Hc for the upper branch, A/m
+        Hm_values = H_values - Hcm  # Field shifted by Hc for the lower branch, A/m
+
+        mu1_values = ne.evaluate("B1_values / (mu_0 * Hp_values)")  # Relative permeability for B1
+        np.maximum(mu1_values, 1.0, out=mu1_values)  # Checking the condition mu >=1
+        mu2_values = ne.evaluate("B2_values / (mu_0 * Hm_values)")  # Relative permeability for B2
+        np.maximum(mu2_values, 1.0, out=mu2_values)  # Checking the condition mu >=1
 
-        R1_values = [(Lm / (S * mu_0 * mu) + Lg / (S * mu_0)) for mu in mu1_values]  # Reluctance for the upper branch
-        R2_values = [(Lm / (S * mu_0 * mu) + Lg / (S * mu_0)) for mu in mu2_values]  # Reluctance for the lower branch
+        Rm_coef = Lm / (S * mu_0)  # Reluctance of the core for mu = 1
+        Rg = Lg / (S * mu_0)  # Reluctance of the gap
+        flux_coef = Lm / S
+        inv_R1_values = ne.evaluate("1.0 / (Rm_coef / mu1_values + Rg)")  # Inverse reluctance for the upper branch
+        inv_R2_values = ne.evaluate("1.0 / (Rm_coef / mu2_values + Rg)")  # Inverse reluctance for the lower branch
 
         # dB - branch vertical adjustment for drawing a minor loop
-        dB = ((H_values[N - 1] + Hcm) / (S * R1_values[N - 1]) - (H_values[N - 1] - Hcm) / (S * R2_values[N - 1])) * Lm / 2.0
+        dB = (Hp_values[N - 1] * inv_R1_values[N - 1] - Hm_values[N - 1] * inv_R2_values[N - 1]) * flux_coef / 2.0
 
-        B1_gapped_values = [((H + Hcm) * Lm / (S * R) - dB) for H, R in zip(H_values, R1_values)]  # Upper branch
-        B2_gapped_values = [((H - Hcm) * Lm / (S * R) + dB) for H, R in zip(H_values, R2_values)]  # Lower branch
+        B1_gapped_values = ne.evaluate("Hp_values * flux_coef * inv_R1_values - dB")  # Upper branch
+        B2_gapped_values = ne.evaluate("Hm_values * flux_coef * inv_R2_values + dB")  # Lower branch
 
         # Find Hc for the gapped BH-loop
-        interp_func = interp1d(B2_gapped_values, H_values, kind='cubic')  # cubic-spline interpolation
-        Hcg = float(interp_func(0))  # Hc_gapped
-
-        # Plot the ungapped BH-loop
-        plt.figure()
-        plt.plot(H_values, B1_values, label='B+')
-        plt.plot(H_values, B2_values, label='B-')
-        plt.xlabel('H, A/m')
-        plt.ylabel('B, T')
-        plt.title('Ungapped BH-loop: both branches')
-        legend_title = f'Hc = {round(Hcm, 2)} A/m'
-        plt.legend(title=legend_title, loc='lower right')  # Set the location of the legend
-        plt.grid(True)
-        plt.minorticks_on()
-        plt.grid(True, which='minor', linestyle=':', linewidth=0.25)
-        plt.show()
-
-        # Save data for the whole BH-loop (both branches)
-        with open('Ungapped_BH-loop_data.csv', mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['H, A/m', 'Upper B, T', 'Lower B, T'])
-            for H, B1, B2 in zip(H_values, B1_values, B2_values):
-                writer.writerow([H, B1, B2])
-
-        # Plot the gapped BH-loop
-        plt.figure()
-        plt.plot(H_values, B1_gapped_values, label='B+')
-        plt.plot(H_values, B2_gapped_values, label='B-')
-        plt.xlabel('H, A/m')
-        plt.ylabel('B, T')
-        plt.title('Gapped BH-loop: both branches')
-        legend_title = f'Hc = {round(Hcg, 2)} A/m'
-        plt.legend(title=legend_title, loc='lower right')  # Set the location of the legend
-        plt.grid(True)
-        plt.minorticks_on()
-        plt.grid(True, which='minor', linestyle=':', linewidth=0.25)
-        plt.show()
+        Hcg = _find_zero_crossing(B2_gapped_values, H_values)  # Hc_gapped
+
+        # Save data for the whole BH-loops (both branches) in the background while the figures are built
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            saved = [executor.submit(_save_csv, 'Ungapped_BH-loop_data.csv', H_values, B1_values, B2_values),
+                     executor.submit(_save_csv, 'Gapped_BH-loop_data.csv', H_values, B1_values, B2_values)]
+
+            # Plot the ungapped BH-loop, the gapped BH-loop and both loops in one figure
+            fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(15, 5), layout='constrained')
+
+            ax1.plot(H_values, B1_values, label='B+')
+            ax1.plot(H_values, B2_values, label='B-')
+            ax1.set_title('Ungapped BH-loop: both branches')
+            ax1.legend(title=f'Hc = {round(Hcm, 2)} A/m', loc='lower right')  # Set the location of the legend
+
+            ax2.plot(H_values, B1_gapped_values, label='B+')
+            ax2.plot(H_values, B2_gapped_values, label='B-')
+            ax2.set_title('Gapped BH-loop: both branches')
+            ax2.legend(title=f'Hc = {round(Hcg, 2)} A/m', loc='lower right')
+
+            ax3.plot(H_values, B1_values, label='B+')
+            ax3.plot(H_values, B2_values, label='B-')
+            ax3.plot(H_values, B1_gapped_values, '--', label='B+ (gapped)')
+            ax3.plot(H_values, B2_gapped_values, '--', label='B- (gapped)')
+            ax3.set_title('Ungapped and gapped BH-loops')
+            legend_title = f'Hc_ungapped = {round(Hcm, 2)} A/m \nHc_gapped = {round(Hcg, 2)} A/m'
+            ax3.legend(title=legend_title, loc='lower right')
+
+            for ax in (ax1, ax2, ax3):
+                ax.set_xlabel('H, A/m')
+                ax.set_ylabel('B, T')
+                ax.minorticks_on()
+                ax.grid(True, which='both')
+
+            for future in saved:
+                future.result()  # Wait for the files and re-raise a failed write
 
-        # Save data for the whole BH-loop (both branches)
-        with open('Gapped_BH-loop_data.csv', mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['H, A/m', 'Upper B, T', 'Lower B, T'])
-            for H, B1, B2 in zip(H_values, B1_values, B2_values):
-                writer.writerow([H, B1, B2])
-
-        # Plot both the ungapped and gapped BH-loops
-        plt.figure()
-        plt.plot(H_values, B1_values, label='B+')
-        plt.plot(H_values, B2_values, label='B-')
-        plt.plot(H_values, B1_gapped_values, '--', label='B+ (gapped)')
-        plt.plot(H_values, B2_gapped_values, '--', label='B- (gapped)')
-        plt.xlabel('H, A/m')
-        plt.ylabel('B, T')
-        plt.title('Ungapped and gapped BH-loops')
-        legend_title = f'Hc_ungapped = {round(Hcm, 2)} A/m \nHc_gapped = {round(Hcg, 2)} A/m'
-        plt.legend(title=legend_title, loc='lower right')
-        plt.grid(True)
-        plt.minorticks_on()
-        plt.grid(True, which='minor', linestyle=':', linewidth=0.25)
         plt.show()
 
     except Exception as e: